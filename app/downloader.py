@@ -1,53 +1,147 @@
+import functools
 import hashlib
+import os
 import shutil
 from pathlib import Path
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+@functools.lru_cache(maxsize=512)
+def _cache_key(text: str) -> str:
+    # Filename key only; no cryptographic strength needed.
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+@functools.lru_cache(maxsize=512)
+def _legacy_cache_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _cache_target(target_dir: Path, key_text: str, ext: str) -> Path:
+    """Return the cache file for `key_text`, preferring an existing legacy name."""
+    legacy = target_dir / f"{_legacy_cache_key(key_text)}{ext}"
+    if legacy.exists():
+        return legacy
+    return target_dir / f"{_cache_key(key_text)}{ext}"
+
+
+def _partial_path(target: Path) -> Path:
+    # Per-process temp name: concurrent jobs may fill the same cache entry.
+    return target.with_name(f"{target.name}.{os.getpid()}.part")
 
 
 class AssetDownloader:
-    def __init__(self, cache_root: Path, timeout_sec: int = 30):
+    def __init__(
+        self,
+        cache_root: Path,
+        timeout_sec: int = 30,
+        http_chunk_size: int = 1024 * 1024,
+    ):
         self.cache_root = cache_root
         self.timeout_sec = timeout_sec
+        self.http_chunk_size = http_chunk_size
+        # Relative local sources resolve against the cwd at construction time.
+        self._cwd = Path.cwd()
         self.cache_root.mkdir(parents=True, exist_ok=True)
+        # (source, subdir) -> cached path, so repeated sources in a job skip
+        # hashing and filesystem checks entirely.
+        self._resolved: dict[tuple[str, str], Path] = {}
+        self._subdirs: dict[str, Path] = {}
+        # One pooled session keeps TCP/TLS connections alive across assets.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.5),
+        )
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def close(self) -> None:
+        self._session.close()
+
+    def _subdir(self, subdir: str) -> Path:
+        # Created once per downloader instead of a mkdir per fetched asset.
+        target_dir = self._subdirs.get(subdir)
+        if target_dir is None:
+            target_dir = self.cache_root / subdir
+            target_dir.mkdir(parents=True, exist_ok=True)
+            self._subdirs[subdir] = target_dir
+        return target_dir
 
     def fetch(self, source: str, subdir: str) -> Path:
         if not source:
             raise ValueError("source must not be empty")
-        target_dir = self.cache_root / subdir
-        target_dir.mkdir(parents=True, exist_ok=True)
+        cached = self._resolved.get((source, subdir))
+        if cached is not None:
+            return cached
+        target_dir = self._subdir(subdir)
 
         parsed = urlparse(source)
         if parsed.scheme in {"http", "https"}:
-            return self._download_http(source, target_dir)
-        return self._copy_local(source, target_dir)
+            resolved = self._download_http(source, target_dir)
+        else:
+            resolved = self._copy_local(source, target_dir)
+        self._resolved[(source, subdir)] = resolved
+        return resolved
 
     def _download_http(self, url: str, target_dir: Path) -> Path:
-        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
         ext = Path(urlparse(url).path).suffix or ".bin"
-        target = target_dir / f"{digest}{ext}"
+        target = _cache_target(target_dir, url, ext)
+        etag_path = target.with_name(f"{target.name}.etag")
+        headers: dict[str, str] = {}
         if target.exists():
-            return target
+            if not etag_path.exists():
+                return target
+            # Revalidate: an unchanged asset costs a 304 instead of a full body.
+            headers["If-None-Match"] = etag_path.read_text(encoding="utf-8").strip()
 
-        response = requests.get(url, timeout=self.timeout_sec, stream=True)
-        response.raise_for_status()
-        with target.open("wb") as fp:
-            for chunk in response.iter_content(chunk_size=1024 * 64):
-                if chunk:
-                    fp.write(chunk)
+        partial = _partial_path(target)
+        try:
+            with self._session.get(
+                url, headers=headers, timeout=self.timeout_sec, stream=True
+            ) as response:
+                if response.status_code == 304:
+                    return target
+                response.raise_for_status()
+                with partial.open("wb") as fp:
+                    for chunk in response.iter_content(chunk_size=self.http_chunk_size):
+                        fp.write(chunk)
+                etag = response.headers.get("ETag")
+            partial.replace(target)
+        except requests.RequestException:
+            if headers:
+                # Revalidation failed; the cached copy is still usable.
+                return target
+            raise
+        finally:
+            partial.unlink(missing_ok=True)
+        if etag:
+            etag_path.write_text(etag, encoding="utf-8")
+        else:
+            etag_path.unlink(missing_ok=True)
         return target
 
     def _copy_local(self, source: str, target_dir: Path) -> Path:
         source_path = Path(source)
         if not source_path.is_absolute():
-            source_path = Path.cwd() / source_path
+            source_path = self._cwd / source_path
         if not source_path.exists():
             raise FileNotFoundError(f"Local source not found: {source_path}")
-        digest = hashlib.sha256(str(source_path).encode("utf-8")).hexdigest()[:16]
         ext = source_path.suffix or ".bin"
-        target = target_dir / f"{digest}{ext}"
+        target = _cache_target(target_dir, str(source_path), ext)
         if target.exists():
             return target
-        shutil.copy2(source_path, target)
+        partial = _partial_path(target)
+        try:
+            # Content cache: no metadata to preserve, and copyfile uses the
+            # kernel fast path (sendfile/fcopyfile) where available.
+            shutil.copyfile(source_path, partial)
+            partial.replace(target)
+        finally:
+            partial.unlink(missing_ok=True)
         return target
@@ -0,0 +1,569 @@
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from .ffmpeg_utils import (
+    available_filters,
+    encode_threads,
+    ffmpeg_binary,
+    filter_value,
+    resolve_video_codec,
+    run_ffmpeg,
+    video_codec_params,
+)
+from .models import (
+    CanvasSpec,
+    JobSpec,
+    ResolvedSegment,
+    SegmentTiming,
+    SubtitleLayout,
+    TimelinePlan,
+)
+from .timeline import cover_frame_duration
+
+# drawtext needs an ffmpeg built with libfreetype; the rest are always present.
+REQUIRED_FILTERS = frozenset({"overlay", "drawtext", "fade", "adelay", "amix"})
+
+
+def ffmpeg_renderer_available() -> bool:
+    return REQUIRED_FILTERS <= available_filters()
+
+
+def _ts(seconds: float) -> str:
+    return f"{seconds:.3f}"
+
+
+def _still_input(image_path: Path, duration: float, fps: int) -> list[str]:
+    # A looped still limited to `duration`, at the output frame rate.
+    return ["-loop", "1", "-framerate", str(fps), "-t", _ts(duration), "-i", str(image_path)]
+
+
+class _Inputs:
+    """ffmpeg input arguments, handing out the index of each added input."""
+
+    def __init__(self) -> None:
+        self.args: list[str] = []
+        self.count = 0
+
+    def add(self, args: list[str]) -> int:
+        self.args.extend(args)
+        self.count += 1
+        return self.count - 1
+
+
+def _overlay_x(timing: SegmentTiming, transition: float, slide_out: bool) -> str:
+    """Overlay x expression reproducing the group-boundary slide motions."""
+    center = "(W-w)/2"
+    x = center
+    if timing.entry == "slide":
+        start, end = _ts(timing.start), _ts(timing.start + transition)
+        x = f"if(lt(t,{end}),W+({center}-W)*(t-{start})/{_ts(transition)},{center})"
+    if slide_out:
+        hold = _ts(timing.start + timing.duration - transition)
+        x = (
+            f"if(gt(t,{hold}),"
+            f"{center}-min(1,(t-{hold})/{_ts(transition)})*({center}+w),{x})"
+        )
+    return x
+
+
+def _fit_filter(canvas: CanvasSpec) -> str:
+    return (
+        f"scale={canvas.width}:{canvas.height}:force_original_aspect_ratio=decrease"
+        ":force_divisible_by=2,setsar=1"
+    )
+
+
+def _drawtext_filters(
+    job: JobSpec,
+    layout: SubtitleLayout,
+    segments: list[ResolvedSegment],
+    timings: list[SegmentTiming],
+    offset: float = 0.0,
+) -> list[str]:
+    """One drawtext per subtitle, enabled over its window shifted by `offset`."""
+    text_bottom = layout.bottom_margin + layout.safe_pad
+    drawtext_style = [
+        f"fontsize={layout.font_size}",
+        f"fontcolor={filter_value(job.subtitle.color)}",
+        f"borderw={layout.stroke_width}",
+        f"bordercolor={filter_value(job.subtitle.stroke_color)}",
+        "expansion=none",
+        f"x={filter_value('max((w-text_w)/2,0)')}",
+        f"y={filter_value(f'max(h-{text_bottom}-text_h,0)')}",
+    ]
+    if layout.font_path:
+        drawtext_style.append(f"fontfile={filter_value(layout.font_path)}")
+    drawtexts: list[str] = []
+    for seg, timing in zip(segments, timings):
+        if timing.subtitle_start is None or timing.subtitle_end is None:
+            continue
+        start, end = _ts(timing.subtitle_start - offset), _ts(timing.subtitle_end - offset)
+        options = [
+            *drawtext_style,
+            f"text={filter_value(seg.comment)}",
+            f"enable={filter_value(f'gte(t,{start})*lt(t,{end})')}",
+        ]
+        drawtexts.append("drawtext=" + ":".join(options))
+    return drawtexts
+
+
+def _canvas_frame(image_path: Path, canvas: CanvasSpec, dest: Path) -> None:
+    """Write `image_path` fitted and centered on a full-canvas background."""
+    size = (canvas.width, canvas.height)
+    with Image.open(image_path) as image:
+        fitted = ImageOps.contain(image.convert("RGBA"), size, Image.Resampling.LANCZOS)
+    frame = Image.new("RGB", size, canvas.bg_color)
+    offset = ((size[0] - fitted.width) // 2, (size[1] - fitted.height) // 2)
+    frame.paste(fitted, offset, fitted)
+    frame.save(dest, compress_level=1)
+
+
+def _concat_entry(path: Path) -> str:
+    return "file '" + str(path).replace("'", "'\\''") + "'"
+
+
+def _write_concat_list(
+    job: JobSpec, segments: list[ResolvedSegment], plan: TimelinePlan, work_dir: Path
+) -> Path:
+    """Concat-demuxer playlist showing each segment's canvas frame back to back."""
+    frames: dict[Path, Path] = {}
+    lines = ["ffconcat version 1.0"]
+    for seg, timing in zip(segments, plan.timings):
+        frame = frames.get(seg.image_path)
+        if frame is None:
+            frame = work_dir / f"frame{len(frames)}.png"
+            _canvas_frame(seg.image_path, job.output.canvas, frame)
+            frames[seg.image_path] = frame
+        lines += [_concat_entry(frame), f"duration {_ts(timing.duration)}"]
+    # The last duration only takes effect when its file is listed once more.
+    lines.append(_concat_entry(frames[segments[-1].image_path]))
+    playlist = work_dir / "stills.ffconcat"
+    playlist.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return playlist
+
+
+def render_job_ffmpeg(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    layout: SubtitleLayout,
+    output_path: Path,
+    bgm_path: Path | None = None,
+    cover_path: Path | None = None,
+) -> Path:
+    """
+    Render the planned timeline with a single ffmpeg filtergraph.
+
+    Scaling, transitions, subtitles and audio mixing all run inside
+    libavfilter, so no frame passes through Python. Hard-cut timelines with
+    render_workers > 1 instead encode segments in parallel and join them
+    without re-encoding.
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    workers = min(job.output.render_workers, len(segments))
+    with tempfile.TemporaryDirectory(prefix="render-") as tmp:
+        work_dir = Path(tmp)
+        if plan.transition <= 0 and workers > 1:
+            _render_cuts_parallel(
+                job,
+                segments,
+                plan,
+                layout,
+                output_path,
+                bgm_path,
+                cover_path,
+                work_dir,
+                workers,
+            )
+        else:
+            cmd = _build_command(
+                job, segments, plan, layout, output_path, bgm_path, cover_path, work_dir
+            )
+            run_ffmpeg(cmd)
+    return output_path
+
+
+def _render_cuts_parallel(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    layout: SubtitleLayout,
+    output_path: Path,
+    bgm_path: Path | None,
+    cover_path: Path | None,
+    work_dir: Path,
+    workers: int,
+) -> None:
+    """Encode each segment to its own MP4 concurrently, then stream-copy them."""
+    canvas = job.output.canvas
+    fps = job.output.fps
+    fit = _fit_filter(canvas)
+    r, g, b = canvas.bg_color
+    pad = (
+        f"pad={canvas.width}:{canvas.height}:(ow-iw)/2:(oh-ih)/2"
+        f":color=0x{r:02x}{g:02x}{b:02x}"
+    )
+    codec = resolve_video_codec(job.output.codec)
+    codec_args = [
+        "-c:v",
+        codec,
+        *video_codec_params(codec),
+        "-threads",
+        str(max(1, encode_threads() // workers)),
+    ]
+
+    commands: list[list[str]] = []
+    lines = ["ffconcat version 1.0"]
+    for idx, (seg, timing) in enumerate(zip(segments, plan.timings)):
+        # Frame counts come from rounded absolute boundaries, so the parts add
+        # up to the planned timeline instead of drifting a frame per segment.
+        start_frame = round(timing.start * fps)
+        frames = max(1, round((timing.start + timing.duration) * fps) - start_frame)
+        inputs = ["-loop", "1", "-framerate", str(fps), "-i", str(seg.image_path)]
+        drawtexts = _drawtext_filters(job, layout, [seg], [timing], timing.start)
+        chain = ",".join([f"[0:v]{fit}", pad, *drawtexts])
+        if idx == 0 and cover_path and cover_path.exists():
+            inputs += _still_input(cover_path, cover_frame_duration(fps), fps)
+            graph = (
+                f"{chain}[base];[1:v]{fit}[cover];[base][cover]"
+                "overlay=x=(W-w)/2:y=(H-h)/2:eof_action=pass,format=yuv420p[vout]"
+            )
+        else:
+            graph = f"{chain},format=yuv420p[vout]"
+        part_path = work_dir / f"segment{idx}.mp4"
+        commands.append(
+            [
+                ffmpeg_binary(),
+                "-y",
+                "-hide_banner",
+                *inputs,
+                "-filter_complex",
+                graph,
+                "-map",
+                "[vout]",
+                "-frames:v",
+                str(frames),
+                *codec_args,
+                str(part_path),
+            ]
+        )
+        lines.append(_concat_entry(part_path))
+    # Each job is its own ffmpeg process, so threads are enough to run them
+    # side by side.
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run_ffmpeg, commands))
+    # Parts share codec settings, so the video is copied, not re-encoded.
+    playlist = work_dir / "segments.ffconcat"
+    playlist.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    mux_video(
+        ["-f", "concat", "-safe", "0", "-i", str(playlist)],
+        job,
+        segments,
+        plan,
+        output_path,
+        bgm_path,
+        cover_path,
+        work_dir,
+    )
+
+
+def _build_command(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    layout: SubtitleLayout,
+    output_path: Path,
+    bgm_path: Path | None,
+    cover_path: Path | None,
+    work_dir: Path,
+) -> list[str]:
+    canvas = job.output.canvas
+    fps = job.output.fps
+    transition = plan.transition
+    total = _ts(plan.total_duration)
+    fit = _fit_filter(canvas)
+
+    inputs = _Inputs()
+    graph: list[str] = []
+    if transition <= 0:
+        # Hard cuts only: stills play back to back, so a single concat input
+        # replaces one looped input and overlay per segment.
+        playlist = _write_concat_list(job, segments, plan, work_dir)
+        k = inputs.add(["-f", "concat", "-safe", "0", "-i", str(playlist)])
+        graph.append(f"[{k}:v]fps={fps},setsar=1[vbase]")
+        video = "[vbase]"
+    else:
+        r, g, b = canvas.bg_color
+        background = (
+            f"color=c=0x{r:02x}{g:02x}{b:02x}:s={canvas.width}x{canvas.height}"
+            f":r={fps}:d={total}"
+        )
+        video = f"[{inputs.add(['-f', 'lavfi', '-i', background])}:v]"
+        fade_in = f",fade=t=in:st=0:d={_ts(transition)}:alpha=1"
+        for idx, (seg, timing) in enumerate(zip(segments, plan.timings)):
+            k = inputs.add(_still_input(seg.image_path, timing.duration, fps))
+            chain = f"[{k}:v]{fit},format=rgba"
+            if timing.entry == "fade":
+                chain += fade_in
+            graph.append(f"{chain},setpts=PTS-STARTPTS+{_ts(timing.start)}/TB[s{idx}]")
+            slide_out = (
+                idx + 1 < len(plan.timings) and plan.timings[idx + 1].entry == "slide"
+            )
+            x = _overlay_x(timing, transition, slide_out)
+            graph.append(
+                f"{video}[s{idx}]overlay=x={filter_value(x)}:y=(H-h)/2"
+                f":eof_action=pass[v{idx}]"
+            )
+            video = f"[v{idx}]"
+
+    drawtexts = _drawtext_filters(job, layout, segments, plan.timings)
+    if drawtexts:
+        graph.append(f"{video}{','.join(drawtexts)}[vsub]")
+        video = "[vsub]"
+
+    if cover_path and cover_path.exists():
+        k = inputs.add(_still_input(cover_path, cover_frame_duration(fps), fps))
+        graph.append(f"[{k}:v]{fit}[cover]")
+        graph.append(f"{video}[cover]overlay=x=(W-w)/2:y=(H-h)/2:eof_action=pass[vcover]")
+        video = "[vcover]"
+    graph.append(f"{video}format=yuv420p[vout]")
+    return _finish_command(
+        job,
+        segments,
+        plan,
+        inputs,
+        graph,
+        output_path,
+        bgm_path,
+        cover_path,
+        work_dir,
+    )
+
+
+def stitch_parts(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    parts: list[tuple[Path, float]],
+    output_path: Path,
+    bgm_path: Path | None,
+    cover_path: Path | None,
+    work_dir: Path,
+) -> Path:
+    """
+    Join separately rendered group parts into the final video.
+
+    `parts` holds (video, timeline start) per group in order. Group boundaries
+    become an xfade slide (a plain concat on hard cuts) and the audio of the
+    whole plan is mixed here, so parts only need to carry video.
+    """
+    inputs = _Inputs()
+    for part_path, _ in parts:
+        inputs.add(["-i", str(part_path)])
+
+    graph: list[str] = []
+    if plan.transition <= 0 or len(parts) == 1:
+        labels = "".join(f"[{k}:v]" for k in range(len(parts)))
+        graph.append(f"{labels}concat=n={len(parts)}:v=1:a=0,format=yuv420p[vout]")
+    else:
+        video = "[0:v]"
+        for k, (_, start) in enumerate(parts[1:], start=1):
+            # Parts sit on the absolute timeline, so each offset is the start
+            # of the incoming group.
+            graph.append(
+                f"{video}[{k}:v]xfade=transition=slideleft"
+                f":duration={_ts(plan.transition)}:offset={_ts(start)}[x{k}]"
+            )
+            video = f"[x{k}]"
+        graph.append(f"{video}format=yuv420p[vout]")
+    cmd = _finish_command(
+        job,
+        segments,
+        plan,
+        inputs,
+        graph,
+        output_path,
+        bgm_path,
+        cover_path,
+        work_dir,
+    )
+    run_ffmpeg(cmd)
+    return output_path
+
+
+def mux_video(
+    video_input: list[str],
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    output_path: Path,
+    bgm_path: Path | None,
+    cover_path: Path | None,
+    work_dir: Path,
+) -> Path:
+    """
+    Copy an already encoded video stream into the output, adding the mixed
+    soundtrack and the attached cover. `video_input` are its input arguments.
+    """
+    inputs = _Inputs()
+    inputs.add(video_input)
+    attached_cover = (
+        inputs.add(["-i", str(cover_path)]) if cover_path and cover_path.exists() else None
+    )
+    audio_graph: list[str] = []
+    has_audio = _audio_mix(job, segments, plan, bgm_path, audio_graph, inputs)
+    cmd = [ffmpeg_binary(), "-y", "-hide_banner", *inputs.args]
+    if has_audio:
+        script_path = work_dir / "audio.ffgraph"
+        script_path.write_text(";\n".join(audio_graph), encoding="utf-8")
+        cmd += ["-filter_complex_script", str(script_path)]
+    cmd += ["-map", "0:v", "-c:v:0", "copy"]
+    if has_audio:
+        cmd += ["-map", "[aout]", "-c:a", "aac"]
+    if attached_cover is not None:
+        cmd += [
+            "-map",
+            f"{attached_cover}:v",
+            "-c:v:1",
+            "mjpeg",
+            "-disposition:v:1",
+            "attached_pic",
+        ]
+    cmd += ["-t", _ts(plan.total_duration), str(output_path)]
+    run_ffmpeg(cmd)
+    return output_path
+
+
+def _audio_mix(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    bgm_path: Path | None,
+    graph: list[str],
+    inputs: _Inputs,
+) -> bool:
+    """Append filters mixing bgm and voices into [aout]; False when silent."""
+    total = _ts(plan.total_duration)
+    audio_labels: list[str] = []
+    if bgm_path and bgm_path.exists():
+        k = inputs.add(["-i", str(bgm_path)])
+        chain = f"[{k}:a]atrim=end={total},asetpts=PTS-STARTPTS"
+        if job.audio.bgm_volume != 1.0:
+            chain += f",volume={job.audio.bgm_volume}"
+        graph.append(f"{chain}[abgm]")
+        audio_labels.append("[abgm]")
+    for idx, (seg, timing) in enumerate(zip(segments, plan.timings)):
+        if timing.voice_length <= 0:
+            continue
+        k = inputs.add(["-i", str(seg.voice_path)])
+        chain = f"[{k}:a]atrim=end={_ts(timing.voice_length)},asetpts=PTS-STARTPTS"
+        if job.audio.voice_volume != 1.0:
+            chain += f",volume={job.audio.voice_volume}"
+        delay_ms = int(round(timing.voice_start * 1000))
+        graph.append(f"{chain},adelay={delay_ms}:all=1[a{idx}]")
+        audio_labels.append(f"[a{idx}]")
+    if not audio_labels:
+        return False
+    if len(audio_labels) == 1:
+        graph.append(f"{audio_labels[0]}anull[aout]")
+    else:
+        # normalize=0 sums tracks like CompositeAudioClip instead of averaging.
+        graph.append(
+            f"{''.join(audio_labels)}amix=inputs={len(audio_labels)}"
+            ":duration=longest:dropout_transition=0:normalize=0[aout]"
+        )
+    return True
+
+
+def premix_audio(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    bgm_path: Path | None,
+    dest: Path,
+) -> Path | None:
+    """Mix the job's soundtrack to a WAV file, or return None when it is silent."""
+    inputs = _Inputs()
+    graph: list[str] = []
+    if not _audio_mix(job, segments, plan, bgm_path, graph, inputs):
+        return None
+    script_path = dest.with_suffix(".ffgraph")
+    script_path.write_text(";\n".join(graph), encoding="utf-8")
+    # Float samples: the summed tracks may exceed full scale before the AAC encode.
+    run_ffmpeg(
+        [
+            ffmpeg_binary(),
+            "-y",
+            "-hide_banner",
+            *inputs.args,
+            "-filter_complex_script",
+            str(script_path),
+            "-map",
+            "[aout]",
+            "-ac",
+            "2",
+            "-ar",
+            "48000",
+            "-c:a",
+            "pcm_f32le",
+            "-t",
+            _ts(plan.total_duration),
+            str(dest),
+        ]
+    )
+    return dest
+
+
+def _finish_command(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    inputs: _Inputs,
+    graph: list[str],
+    output_path: Path,
+    bgm_path: Path | None,
+    cover_path: Path | None,
+    work_dir: Path,
+) -> list[str]:
+    """Append the audio mix to a graph ending in [vout] and build the command."""
+    total = _ts(plan.total_duration)
+    # Muxed as an attached picture in the same pass, not a second remux.
+    attached_cover = (
+        inputs.add(["-i", str(cover_path)]) if cover_path and cover_path.exists() else None
+    )
+
+    has_audio = _audio_mix(job, segments, plan, bgm_path, graph, inputs)
+
+    # Large jobs exceed command-line limits, so the graph goes through a file.
+    script_path = work_dir / "graph.ffgraph"
+    script_path.write_text(";\n".join(graph), encoding="utf-8")
+    cmd = [
+        ffmpeg_binary(),
+        "-y",
+        "-hide_banner",
+        *inputs.args,
+        "-filter_complex_script",
+        str(script_path),
+        "-map",
+        "[vout]",
+    ]
+    if has_audio:
+        cmd += ["-map", "[aout]", "-c:a", "aac"]
+    codec = resolve_video_codec(job.output.codec)
+    cmd += ["-c:v", codec, *video_codec_params(codec), "-threads", str(encode_threads())]
+    if attached_cover is not None:
+        cmd += [
+            "-map",
+            f"{attached_cover}:v",
+            "-c:v:1",
+            "mjpeg",
+            "-disposition:v:1",
+            "attached_pic",
+        ]
+    # The graph already emits yuv420p frames at the output rate.
+    cmd += ["-t", total, str(output_path)]
+    return cmd
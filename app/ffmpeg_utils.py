@@ -0,0 +1,222 @@
+import functools
+import os
+import shutil
+import subprocess
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+PROBE_WORKERS = 8
+# Encoder threads per render; ffmpeg's own default often leaves cores idle.
+# Lowered via set_encode_threads when several renders share the machine.
+_encode_threads = os.cpu_count() or 1
+# Hardware H.264 encoders in order of preference; libx264 is the CPU fallback.
+HW_VIDEO_CODECS = ("h264_nvenc", "h264_videotoolbox", "h264_qsv")
+# Speed-oriented settings per encoder, appended after the codec selection.
+VIDEO_CODEC_PARAMS = {
+    "h264_nvenc": ["-preset", "p1", "-tune", "ll", "-rc", "vbr", "-cq", "23"],
+    "h264_videotoolbox": ["-b:v", "8M", "-allow_sw", "1"],
+    "h264_qsv": ["-preset", "veryfast"],
+    # Slice threads split each (tall) frame across cores instead of only
+    # pipelining whole frames.
+    "libx264": ["-preset", "ultrafast", "-x264-params", "sliced-threads=1"],
+}
+
+
+def encode_threads() -> int:
+    return _encode_threads
+
+
+def set_encode_threads(count: int) -> None:
+    global _encode_threads
+    _encode_threads = max(1, count)
+
+
+@functools.lru_cache(maxsize=1)
+def _ffprobe_bin() -> Optional[str]:
+    return shutil.which("ffprobe")
+
+
+def ffmpeg_binary() -> str:
+    # Same binary MoviePy encodes with (FFMPEG_BINARY env var or imageio-ffmpeg).
+    return FFMPEG_BINARY
+
+
+def _encoder_works(codec: str) -> bool:
+    # Builds often list hardware encoders the machine cannot drive; a one-frame
+    # test encode is the only reliable check.
+    result = subprocess.run(
+        [
+            ffmpeg_binary(),
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            "color=s=256x256:d=0.1",
+            "-frames:v",
+            "1",
+            "-c:v",
+            codec,
+            "-f",
+            "null",
+            "-",
+        ],
+        capture_output=True,
+    )
+    return result.returncode == 0
+
+
+@functools.lru_cache(maxsize=1)
+def detect_video_codec() -> str:
+    """Return the fastest usable H.264 encoder, probed once per process."""
+    result = subprocess.run(
+        [ffmpeg_binary(), "-hide_banner", "-encoders"],
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    for codec in HW_VIDEO_CODECS:
+        if codec in result.stdout and _encoder_works(codec):
+            return codec
+    return "libx264"
+
+
+@functools.lru_cache(maxsize=1)
+def available_filters() -> frozenset[str]:
+    result = subprocess.run(
+        [ffmpeg_binary(), "-hide_banner", "-filters"],
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    # Rows look like " TSC overlay  VV->V  Overlay a video source on top of ..."
+    return frozenset(
+        parts[1] for parts in map(str.split, result.stdout.splitlines()) if len(parts) > 2
+    )
+
+
+def resolve_video_codec(codec: str) -> str:
+    return detect_video_codec() if codec == "auto" else codec
+
+
+def video_codec_params(codec: str) -> list[str]:
+    return list(VIDEO_CODEC_PARAMS.get(codec, []))
+
+
+def filter_value(value: str) -> str:
+    """Quote `value` for use as a filter option inside a filtergraph."""
+    # Inner level: the filter's option parser splits on ':' and unescapes '\\'.
+    escaped = value.replace("\\", "\\\\").replace("'", "\\'").replace(":", "\\:")
+    # Outer level: the graph parser; single quotes keep ',;[]' literal.
+    return "'" + escaped.replace("'", "'\\''") + "'"
+
+
+def run_ffmpeg(cmd: list[str]) -> None:
+    try:
+        subprocess.run(
+            cmd,
+            check=True,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+    except subprocess.CalledProcessError as err:
+        tail = "\n".join(err.stderr.strip().splitlines()[-10:])
+        raise RuntimeError(f"ffmpeg failed: {tail}") from err
+
+
+def probe_duration(path: Path) -> float:
+    """Return media duration in seconds without decoding any samples."""
+    stat = path.stat()
+    return _probe_duration(path, stat.st_mtime_ns, stat.st_size)
+
+
+# Keyed by mtime and size too, so a re-downloaded cache file is probed again.
+@functools.lru_cache(maxsize=1024)
+def _probe_duration(path: Path, mtime_ns: int, size: int) -> float:
+    ffprobe_bin = _ffprobe_bin()
+    if ffprobe_bin:
+        result = subprocess.run(
+            [
+                ffprobe_bin,
+                "-v",
+                "error",
+                "-show_entries",
+                "format=duration",
+                "-of",
+                "default=nw=1:nk=1",
+                str(path),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        try:
+            return float(result.stdout.strip())
+        except ValueError:
+            pass
+    # MoviePy's bundled ffmpeg ships without ffprobe; parse `ffmpeg -i` instead.
+    return float(ffmpeg_parse_infos(str(path))["duration"])
+
+
+def _probe_if_exists(path: Path) -> Optional[float]:
+    return probe_duration(path) if path.exists() else None
+
+
+def probe_durations(paths: Iterable[Path]) -> dict[Path, float]:
+    """
+    Probe several files concurrently; each probe is one short subprocess.
+
+    Missing files are left out of the result.
+    """
+    unique = list(dict.fromkeys(paths))
+    if not unique:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(unique))) as executor:
+        durations = dict(zip(unique, executor.map(_probe_if_exists, unique)))
+    return {path: duration for path, duration in durations.items() if duration is not None}
+
+
+def attach_cover_art(video_path: Path, cover_path: Path) -> None:
+    """Remux `video_path` in place with `cover_path` as an attached picture."""
+    if not video_path.exists() or not cover_path.exists():
+        return
+
+    tmp_path = video_path.with_name(f"{video_path.stem}.with_cover{video_path.suffix}")
+    cmd = [
+        ffmpeg_binary(),
+        "-y",
+        "-i",
+        str(video_path),
+        "-i",
+        str(cover_path),
+        "-map",
+        "0",
+        "-map",
+        "1",
+        "-c",
+        "copy",
+        "-c:v:1",
+        "mjpeg",
+        "-disposition:v:1",
+        "attached_pic",
+        str(tmp_path),
+    ]
+    try:
+        run_ffmpeg(cmd)
+        tmp_path.replace(video_path)
+    except RuntimeError as err:
+        print(f"[WARN] Failed to attach cover metadata: {err}")
+        if tmp_path.exists():
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
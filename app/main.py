@@ -1,13 +1,18 @@
 import argparse
-import shutil
-import subprocess
+import functools
+import os
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Optional
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DOWNLOAD_WORKERS = 16
 
 try:
     from .downloader import AssetDownloader
-    from .models import ResolvedSegment
+    from .ffmpeg_utils import set_encode_threads
+    from .models import JobSpec, ResolvedSegment
     from .parser import parse_job_file
     from .renderer import render_job
     from .timeline import build_sequence_nodes
@@ -19,7 +24,8 @@ except ImportError:
         sys.path.insert(0, str(PROJECT_ROOT))
 
     from app.downloader import AssetDownloader
-    from app.models import ResolvedSegment
+    from app.ffmpeg_utils import set_encode_threads
+    from app.models import JobSpec, ResolvedSegment
     from app.parser import parse_job_file
     from app.renderer import render_job
     from app.timeline import build_sequence_nodes
@@ -27,21 +33,25 @@ except ImportError:
 
 def run(job_path: Path, output_dir: Path, cache_dir: Path) -> Path:
     job = parse_job_file(job_path)
-    sequence = build_sequence_nodes(job)
-    if not sequence:
+    # Every group has an original node, so no groups means no nodes.
+    if not job.groups:
         raise ValueError("No nodes found in job config.")
 
     downloader = AssetDownloader(cache_root=cache_dir)
+    try:
+        assets = _prefetch_assets(downloader, job)
+    finally:
+        downloader.close()
     segments: list[ResolvedSegment] = []
 
-    for group_id, kind, node in sequence:
-        image_path = downloader.fetch(node.image_url, "images")
+    for group_id, kind, node in build_sequence_nodes(job):
+        image_path = assets[(node.image_url, "images")]
         # New format: each node has narrations[].
         # Expand one node into multiple segments (same image, different narration).
         if node.narrations:
             for narration in node.narrations:
                 voice_path = (
-                    downloader.fetch(narration.voice_url, "audio")
+                    assets[(narration.voice_url, "audio")]
                     if narration.voice_url
                     else None
                 )
@@ -66,60 +76,44 @@ def run(job_path: Path, output_dir: Path, cache_dir: Path) -> Path:
                 )
             )
 
-    bgm_path = downloader.fetch(job.audio.bgm_url, "audio") if job.audio.bgm_url else None
-    cover_path = downloader.fetch(job.output.cover, "images") if job.output.cover else None
+    bgm_path = assets[(job.audio.bgm_url, "audio")] if job.audio.bgm_url else None
+    cover_path = assets[(job.output.cover, "images")] if job.output.cover else None
 
     output_path = output_dir / job.output.filename
-    rendered_output = render_job(
+    return render_job(
         job=job,
         segments=segments,
         bgm_path=bgm_path,
         cover_path=cover_path,
         output_path=output_path,
     )
-    if cover_path:
-        _attach_cover_art(rendered_output, cover_path)
-    return rendered_output
 
 
-def _attach_cover_art(video_path: Path, cover_path: Path) -> None:
-    ffmpeg_bin = shutil.which("ffmpeg")
-    if not ffmpeg_bin:
-        print("[WARN] ffmpeg not found in PATH. Skip attached cover metadata.")
-        return
-    if not video_path.exists() or not cover_path.exists():
-        return
-
-    tmp_path = video_path.with_name(f"{video_path.stem}.with_cover{video_path.suffix}")
-    cmd = [
-        ffmpeg_bin,
-        "-y",
-        "-i",
-        str(video_path),
-        "-i",
-        str(cover_path),
-        "-map",
-        "0",
-        "-map",
-        "1",
-        "-c",
-        "copy",
-        "-c:v:1",
-        "mjpeg",
-        "-disposition:v:1",
-        "attached_pic",
-        str(tmp_path),
-    ]
-    try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-        tmp_path.replace(video_path)
-    except subprocess.CalledProcessError as err:
-        print(f"[WARN] Failed to attach cover metadata: {err.stderr.strip()}")
-        if tmp_path.exists():
-            try:
-                tmp_path.unlink()
-            except OSError:
-                pass
+def _prefetch_assets(
+    downloader: AssetDownloader, job: JobSpec
+) -> dict[tuple[str, str], Path]:
+    """Fetch every distinct asset of a job concurrently.
+
+    Downloads are network-bound and independent, so a bounded thread pool
+    overlaps them instead of paying one round trip per asset in sequence.
+    Duplicate urls (e.g. an image shared by several narrations) are fetched once.
+    """
+    wanted: dict[tuple[str, str], None] = {}
+    for entry in build_sequence_nodes(job):
+        wanted[(entry.node.image_url, "images")] = None
+        for narration in entry.node.narrations:
+            if narration.voice_url:
+                wanted[(narration.voice_url, "audio")] = None
+    if job.audio.bgm_url:
+        wanted[(job.audio.bgm_url, "audio")] = None
+    if job.output.cover:
+        wanted[(job.output.cover, "images")] = None
+
+    keys = list(wanted)
+    workers = max(1, min(DOWNLOAD_WORKERS, len(keys)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        paths = list(executor.map(lambda key: downloader.fetch(*key), keys))
+    return dict(zip(keys, paths))
 
 
 def build_arg_parser() -> argparse.ArgumentParser:
@@ -140,9 +134,16 @@ def build_arg_parser() -> argparse.ArgumentParser:
         default="cache",
         help="Asset cache directory (default: cache)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Jobs rendered in parallel (default: auto, half the CPU cores)",
+    )
     return parser
 
 
+@functools.lru_cache(maxsize=64)
 def _resolve_path(raw_path: str, base: Path) -> Path:
     path = Path(raw_path)
     if path.is_absolute():
@@ -150,6 +151,48 @@ def _resolve_path(raw_path: str, base: Path) -> Path:
     return (base / path).resolve()
 
 
+def _default_job_workers(job_count: int) -> int:
+    # Each job composites frames in Python besides encoding, so two cores per
+    # job keep the encoders busy; _run_jobs splits the encoder threads evenly.
+    return max(1, min(job_count, (os.cpu_count() or 2) // 2))
+
+
+def _run_logged(job_path: Path, output_dir: Path, cache_dir: Path) -> Path:
+    print(f"[START] {job_path}", flush=True)
+    return run(job_path, output_dir, cache_dir)
+
+
+def _run_jobs(
+    job_paths: list[Path], output_dir: Path, cache_dir: Path, workers: int
+) -> Iterator[tuple[Path, Optional[Path], Optional[Exception]]]:
+    """Run jobs and yield (job_path, output, error) as each one finishes."""
+    if workers <= 1:
+        for job_path in job_paths:
+            print(f"[START] {job_path}")
+            try:
+                yield job_path, run(job_path, output_dir, cache_dir), None
+            except Exception as err:
+                yield job_path, None, err
+        return
+
+    # Each encoder gets its share of the cores instead of all of them.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=set_encode_threads,
+        initargs=((os.cpu_count() or 1) // workers,),
+    ) as executor:
+        futures = {
+            executor.submit(_run_logged, job_path, output_dir, cache_dir): job_path
+            for job_path in job_paths
+        }
+        for future in as_completed(futures):
+            job_path = futures[future]
+            try:
+                yield job_path, future.result(), None
+            except Exception as err:
+                yield job_path, None, err
+
+
 def main() -> None:
     parser = build_arg_parser()
     args = parser.parse_args()
@@ -164,16 +207,15 @@ def main() -> None:
         if not job_paths:
             raise FileNotFoundError(f"No json jobs found in: {jobs_dir}")
 
+    workers = args.workers if args.workers > 0 else _default_job_workers(len(job_paths))
     succeeded: list[Path] = []
     failed: list[tuple[Path, str]] = []
 
-    for job_path in job_paths:
-        print(f"[START] {job_path}")
-        try:
-            output = run(job_path=job_path, output_dir=output_dir, cache_dir=cache_dir)
+    for job_path, output, err in _run_jobs(job_paths, output_dir, cache_dir, workers):
+        if err is None:
             print(f"[OK] {job_path.name} -> {output}")
             succeeded.append(job_path)
-        except Exception as err:
+        else:
             print(f"[FAIL] {job_path.name}: {err}")
             failed.append((job_path, str(err)))
 
@@ -3,48 +3,60 @@ from pathlib import Path
 from typing import Optional
 
 
-@dataclass
+@dataclass(slots=True)
 class NarrationSpec:
     comment: str = ""
     voice_url: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class NodeSpec:
     image_url: str
     narrations: list[NarrationSpec] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class GroupSpec:
     group_id: str
     original: NodeSpec
     effects: list[NodeSpec]
 
 
-@dataclass
+@dataclass(slots=True)
 class CanvasSpec:
     width: int = 1440
     height: int = 2560
     bg_color: tuple[int, int, int] = (0, 0, 0)
 
 
-@dataclass
+@dataclass(slots=True)
 class OutputSpec:
     filename: str = "output.mp4"
     fps: int = 30
     cover: Optional[str] = None
     canvas: CanvasSpec = field(default_factory=CanvasSpec)
-
-
-@dataclass
+    # "moviepy" composites frames in Python; "ffmpeg" renders one filtergraph;
+    # "pyav" composites with numpy and encodes in-process (needs PyAV);
+    # "auto" uses ffmpeg when its build has the required filters, then pyav.
+    # MoviePy stays the default so existing jobs keep their current output.
+    renderer: str = "moviepy"
+    # H.264 encoder; "auto" prefers an available hardware encoder.
+    codec: str = "auto"
+    # Parallel parts per render, stitched with ffmpeg: MoviePy renders groups
+    # in processes; ffmpeg encodes segments concurrently only when
+    # transition_sec is 0; pyav ignores it. 1 = one pass. Ignored settings are
+    # reported with a warning.
+    render_workers: int = 1
+
+
+@dataclass(slots=True)
 class AudioSpec:
     bgm_url: Optional[str] = None
     bgm_volume: float = 0.25
     voice_volume: float = 1.0
 
 
-@dataclass
+@dataclass(slots=True)
 class SubtitleSpec:
     font_path: Optional[str] = "C:/Windows/Fonts/msyh.ttc"
     font_size: int = 72
@@ -54,14 +66,14 @@ class SubtitleSpec:
     bottom_margin: int = 100
 
 
-@dataclass
+@dataclass(slots=True)
 class TimelineSpec:
     transition_sec: float = 0.5
     default_still_sec: float = 2.0
     voice_start_offset_sec: float = 0.0
 
 
-@dataclass
+@dataclass(slots=True)
 class JobSpec:
     job_id: str
     groups: list[GroupSpec]
@@ -71,10 +83,38 @@ class JobSpec:
     timeline: TimelineSpec = field(default_factory=TimelineSpec)
 
 
-@dataclass
+@dataclass(slots=True)
 class ResolvedSegment:
     group_id: str
     kind: str
     image_path: Path
     comment: str = ""
     voice_path: Optional[Path] = None
+
+
+@dataclass(slots=True)
+class SubtitleLayout:
+    font_size: int
+    stroke_width: int
+    bottom_margin: int
+    safe_pad: int
+    font_path: Optional[str] = None
+
+
+@dataclass(slots=True)
+class SegmentTiming:
+    start: float
+    duration: float
+    # How the segment enters: "cut", "fade" (same group) or "slide" (new group).
+    entry: str = "cut"
+    voice_start: float = 0.0
+    voice_length: float = 0.0
+    subtitle_start: Optional[float] = None
+    subtitle_end: Optional[float] = None
+
+
+@dataclass(slots=True)
+class TimelinePlan:
+    timings: list[SegmentTiming]
+    transition: float
+    total_duration: float
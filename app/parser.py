@@ -2,6 +2,16 @@ import json
 from pathlib import Path
 from typing import Any
 
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+try:
+    import fastjsonschema
+except ImportError:  # optional speedup
+    fastjsonschema = None
+
 from .models import (
     AudioSpec,
     CanvasSpec,
@@ -14,80 +24,178 @@ from .models import (
     TimelineSpec,
 )
 
-
-def _as_str(value: Any, field_name: str) -> str:
-    if not isinstance(value, str) or not value.strip():
-        raise ValueError(f"Invalid {field_name}: expected non-empty string.")
-    return value.strip()
-
-
-def _parse_node(raw: dict[str, Any], field_name: str) -> NodeSpec:
+RENDERERS = ("auto", "moviepy", "ffmpeg", "pyav")
+
+_NODE_SCHEMA = {
+    "type": "object",
+    "required": ["image_url"],
+    "properties": {
+        "image_url": {"type": "string", "pattern": r"\S"},
+        "narrations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"voice_url": {"type": ["string", "null"]}},
+            },
+        },
+    },
+}
+
+JOB_SCHEMA = {
+    "type": "object",
+    "required": ["groups"],
+    "properties": {
+        "groups": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "required": ["original"],
+                "properties": {
+                    "original": _NODE_SCHEMA,
+                    "effects": {"type": "array", "items": _NODE_SCHEMA},
+                },
+            },
+        },
+        "output": {
+            "type": "object",
+            "properties": {
+                "canvas": {
+                    "type": "object",
+                    "properties": {
+                        "bg_color": {
+                            "type": "array",
+                            "items": {"type": "integer"},
+                            "minItems": 3,
+                            "maxItems": 3,
+                        },
+                    },
+                },
+                "renderer": {"enum": list(RENDERERS)},
+                "render_workers": {"type": "integer", "minimum": 1},
+            },
+        },
+        "audio": {"type": "object"},
+        "subtitle": {"type": "object"},
+        "timeline": {"type": "object"},
+    },
+}
+
+# Compiled once to straight-line Python. When fastjsonschema is not
+# installed, _check_job enforces exactly these constraints by hand, so a job
+# file is valid or not regardless of which path runs; either way the _parse_*
+# functions below only normalise values.
+_validate_job = fastjsonschema.compile(JOB_SCHEMA) if fastjsonschema else None
+
+
+def _is_int(value: Any) -> bool:
+    # JSON Schema's "integer" excludes booleans, which Python counts as ints.
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _check_node(raw: Any, field_name: str) -> None:
     if not isinstance(raw, dict):
         raise ValueError(f"Invalid {field_name}: expected object.")
-    image_url = _as_str(raw.get("image_url"), f"{field_name}.image_url")
+    image_url = raw.get("image_url")
+    if not isinstance(image_url, str) or not image_url.strip():
+        raise ValueError(f"Invalid {field_name}.image_url: expected non-empty string.")
     narrations_raw = raw.get("narrations", [])
     if not isinstance(narrations_raw, list):
         raise ValueError(f"Invalid {field_name}.narrations: expected array.")
-    narrations: list[NarrationSpec] = []
     for idx, item in enumerate(narrations_raw):
         if not isinstance(item, dict):
             raise ValueError(
                 f"Invalid {field_name}.narrations[{idx}]: expected object."
             )
-        comment = str(item.get("comment", "")).strip()
         voice_raw = item.get("voice_url")
-        voice_url = None
-        if isinstance(voice_raw, str):
-            voice_url = voice_raw.strip() or None
-        elif voice_raw is None:
-            voice_url = None
-        else:
+        if voice_raw is not None and not isinstance(voice_raw, str):
             raise ValueError(
                 f"Invalid {field_name}.narrations[{idx}].voice_url: expected string or null."
             )
 
+
+def _check_job(raw: Any) -> None:
+    """Hand-written equivalent of JOB_SCHEMA, used without fastjsonschema."""
+    if not isinstance(raw, dict):
+        raise ValueError("Invalid job json: expected object.")
+    groups_raw = raw.get("groups")
+    if not isinstance(groups_raw, list) or not groups_raw:
+        raise ValueError("Invalid job json: groups must be a non-empty array.")
+    for index, group_raw in enumerate(groups_raw):
+        if not isinstance(group_raw, dict):
+            raise ValueError(f"Invalid groups[{index}]: expected object.")
+        _check_node(group_raw.get("original"), f"groups[{index}].original")
+        effects_raw = group_raw.get("effects", [])
+        if not isinstance(effects_raw, list):
+            raise ValueError(f"Invalid groups[{index}].effects: expected array.")
+        for i, item in enumerate(effects_raw):
+            _check_node(item, f"groups[{index}].effects[{i}]")
+
+    for section in ("output", "audio", "subtitle", "timeline"):
+        if not isinstance(raw.get(section, {}), dict):
+            raise ValueError(f"Invalid job json: {section} must be object.")
+
+    output_raw = raw.get("output", {})
+    canvas_raw = output_raw.get("canvas", {})
+    if not isinstance(canvas_raw, dict):
+        raise ValueError("Invalid job json: output.canvas must be object.")
+    bg_color_raw = canvas_raw.get("bg_color", [0, 0, 0])
+    if not (
+        isinstance(bg_color_raw, list)
+        and len(bg_color_raw) == 3
+        and all(_is_int(c) for c in bg_color_raw)
+    ):
+        raise ValueError("output.canvas.bg_color must be [r,g,b].")
+    if output_raw.get("renderer", "moviepy") not in RENDERERS:
+        raise ValueError(
+            "output.renderer must be one of: " + ", ".join(f'"{r}"' for r in RENDERERS)
+        )
+    render_workers = output_raw.get("render_workers", 1)
+    if not _is_int(render_workers) or render_workers < 1:
+        raise ValueError("output.render_workers must be an integer >= 1.")
+
+
+def _parse_node(raw: dict[str, Any]) -> NodeSpec:
+    narrations: list[NarrationSpec] = []
+    for item in raw.get("narrations", []):
+        comment = str(item.get("comment", "")).strip()
+        voice_url = (item.get("voice_url") or "").strip() or None
+
         # 新规则：comment 或 voice_url 任一为空，跳过该 narration（不报错）
         if not comment or not voice_url:
             continue
         narrations.append(NarrationSpec(comment=comment, voice_url=voice_url))
-    return NodeSpec(image_url=image_url, narrations=narrations)
+    return NodeSpec(image_url=raw["image_url"].strip(), narrations=narrations)
 
 
 def _parse_group(raw: dict[str, Any], index: int) -> GroupSpec:
-    if not isinstance(raw, dict):
-        raise ValueError(f"Invalid groups[{index}]: expected object.")
     group_id = str(raw.get("group_id") or f"group-{index+1}")
-    original = _parse_node(raw.get("original"), f"groups[{index}].original")
-    effects_raw = raw.get("effects", [])
-    if not isinstance(effects_raw, list):
-        raise ValueError(f"Invalid groups[{index}].effects: expected array.")
-    effects = [
-        _parse_node(item, f"groups[{index}].effects[{i}]")
-        for i, item in enumerate(effects_raw)
-    ]
+    original = _parse_node(raw["original"])
+    effects = [_parse_node(item) for item in raw.get("effects", [])]
     return GroupSpec(group_id=group_id, original=original, effects=effects)
 
 
-def parse_job_file(job_path: Path) -> JobSpec:
-    raw = json.loads(job_path.read_text(encoding="utf-8"))
+def _load_json(job_path: Path) -> Any:
+    if orjson is not None:
+        return orjson.loads(job_path.read_bytes())
+    return json.loads(job_path.read_text(encoding="utf-8"))
 
-    if not isinstance(raw, dict):
-        raise ValueError("Invalid job json: expected object.")
 
-    groups_raw = raw.get("groups")
-    if not isinstance(groups_raw, list) or not groups_raw:
-        raise ValueError("Invalid job json: groups must be a non-empty array.")
-    groups = [_parse_group(item, i) for i, item in enumerate(groups_raw)]
+def parse_job_file(job_path: Path) -> JobSpec:
+    raw = _load_json(job_path)
+    if _validate_job is not None:
+        try:
+            _validate_job(raw)
+        except fastjsonschema.JsonSchemaException as err:
+            raise ValueError(f"Invalid job json: {err.message}") from err
+    else:
+        _check_job(raw)
+
+    groups = [_parse_group(item, i) for i, item in enumerate(raw["groups"])]
 
     output_raw = raw.get("output", {})
     canvas_raw = output_raw.get("canvas", {})
     bg_color_raw = canvas_raw.get("bg_color", [0, 0, 0])
-    if not (
-        isinstance(bg_color_raw, list)
-        and len(bg_color_raw) == 3
-        and all(isinstance(c, int) for c in bg_color_raw)
-    ):
-        raise ValueError("output.canvas.bg_color must be [r,g,b].")
     canvas = CanvasSpec(
         width=int(canvas_raw.get("width", 1440)),
         height=int(canvas_raw.get("height", 2560)),
@@ -103,6 +211,9 @@ def parse_job_file(job_path: Path) -> JobSpec:
             else None
         ),
         canvas=canvas,
+        renderer=output_raw.get("renderer", "moviepy"),
+        codec=str(output_raw.get("codec", "auto")),
+        render_workers=output_raw.get("render_workers", 1),
     )
 
     audio_raw = raw.get("audio", {})
@@ -0,0 +1,266 @@
+import bisect
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from .ffmpeg_renderer import mux_video
+from .ffmpeg_utils import encode_threads, resolve_video_codec, video_codec_params
+from .models import JobSpec, ResolvedSegment, SubtitleLayout, TimelinePlan
+from .rendering_utils import background_frame, fitted_image, subtitle_bitmap
+from .timeline import cover_frame_duration
+
+try:
+    import av
+except ImportError:  # optional speedup
+    av = None
+
+
+class _Layer(NamedTuple):
+    start: float
+    end: float
+    rgb: np.ndarray
+    # Per-pixel opacity in [0, 1] as HxWx1 float32; None for opaque images.
+    alpha: np.ndarray | None
+    x: int
+    y: int
+    fade_in: float = 0.0
+    slide_in: float = 0.0
+    slide_out: float = 0.0
+
+
+def pyav_renderer_available() -> bool:
+    return av is not None
+
+
+def _image_layer(
+    image: np.ndarray, start: float, end: float, x: int, y: int, **motion: float
+) -> _Layer:
+    alpha = None
+    if image.shape[2] == 4:
+        alpha = image[:, :, 3:4].astype(np.float32) / 255.0
+    return _Layer(start, end, np.ascontiguousarray(image[:, :, :3]), alpha, x, y, **motion)
+
+
+def _is_animated(layer: _Layer, t: float) -> bool:
+    local = t - layer.start
+    return (
+        local < layer.fade_in or local < layer.slide_in or t > layer.end - layer.slide_out
+    )
+
+
+def _layer_state(layer: _Layer, t: float, canvas_w: int) -> tuple[int, float]:
+    """x position and opacity of `layer` at time `t`; same motion as MoviePy."""
+    x = float(layer.x)
+    local = t - layer.start
+    if local < layer.slide_in:
+        x = canvas_w - max(0.0, local) * (canvas_w - layer.x) / layer.slide_in
+    hold_until = layer.end - layer.slide_out
+    if layer.slide_out and t > hold_until:
+        width = layer.rgb.shape[1]
+        x = max(-width, layer.x - (t - hold_until) * (layer.x + width) / layer.slide_out)
+    opacity = min(1.0, max(0.0, local) / layer.fade_in) if layer.fade_in else 1.0
+    return int(round(x)), opacity
+
+
+def _blit(frame: np.ndarray, layer: _Layer, x: int, opacity: float) -> None:
+    """Composite `layer` onto `frame` in place at (x, layer.y)."""
+    h, w = layer.rgb.shape[:2]
+    y = layer.y
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, frame.shape[1]), min(y + h, frame.shape[0])
+    if x0 >= x1 or y0 >= y1 or opacity <= 0:
+        return
+    src = layer.rgb[y0 - y : y1 - y, x0 - x : x1 - x]
+    dst = frame[y0:y1, x0:x1]
+    if layer.alpha is None and opacity >= 1.0:
+        dst[...] = src
+        return
+    alpha = opacity
+    if layer.alpha is not None:
+        alpha = layer.alpha[y0 - y : y1 - y, x0 - x : x1 - x] * opacity
+    blended = dst.astype(np.float32)
+    blended += (src - blended) * alpha
+    dst[...] = blended
+
+
+def _build_layers(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    layout: SubtitleLayout,
+    cover_path: Path | None,
+) -> list[_Layer]:
+    """All layers of the timeline in compositing order (bottom first)."""
+    canvas = job.output.canvas
+    width, height = canvas.width, canvas.height
+    transition = plan.transition
+    fitted: dict[Path, np.ndarray] = {}
+    for seg in segments:
+        if seg.image_path not in fitted:
+            fitted[seg.image_path] = fitted_image(seg.image_path, width, height)
+
+    # Comments often repeat within a job; rasterize each distinct one once.
+    bitmaps: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+    stills: list[_Layer] = []
+    subtitles: list[_Layer] = []
+    for idx, (seg, timing) in enumerate(zip(segments, plan.timings)):
+        image = fitted[seg.image_path]
+        x = (width - image.shape[1]) // 2
+        y = (height - image.shape[0]) // 2
+        slide_out = (
+            transition
+            if idx + 1 < len(plan.timings) and plan.timings[idx + 1].entry == "slide"
+            else 0.0
+        )
+        stills.append(
+            _image_layer(
+                image,
+                timing.start,
+                timing.start + timing.duration,
+                x,
+                y,
+                fade_in=transition if timing.entry == "fade" else 0.0,
+                slide_in=transition if timing.entry == "slide" else 0.0,
+                slide_out=slide_out,
+            )
+        )
+
+        if timing.subtitle_start is not None:
+            if seg.comment not in bitmaps:
+                bitmaps[seg.comment] = subtitle_bitmap(
+                    seg.comment,
+                    layout.font_path,
+                    layout.font_size,
+                    job.subtitle.color,
+                    job.subtitle.stroke_color,
+                    layout.stroke_width,
+                    layout.safe_pad,
+                )
+            rgb, mask = bitmaps[seg.comment]
+            sub_h, sub_w = rgb.shape[:2]
+            subtitles.append(
+                _Layer(
+                    timing.subtitle_start,
+                    timing.subtitle_end,
+                    rgb,
+                    mask[:, :, None],
+                    max(0, (width - sub_w) // 2),
+                    max(0, height - layout.bottom_margin - sub_h),
+                )
+            )
+
+    layers = [*stills, *subtitles]
+    if cover_path and cover_path.exists():
+        cover = fitted_image(cover_path, width, height)
+        layers.append(
+            _image_layer(
+                cover,
+                0.0,
+                cover_frame_duration(job.output.fps),
+                (width - cover.shape[1]) // 2,
+                (height - cover.shape[0]) // 2,
+            )
+        )
+    return layers
+
+
+def _codec_options(params: list[str]) -> dict[str, str]:
+    # ["-preset", "p1", "-b:v", "8M"] -> {"preset": "p1", "b": "8M"}
+    return {
+        key.lstrip("-").removesuffix(":v"): value
+        for key, value in zip(params[::2], params[1::2])
+    }
+
+
+def _open_video_stream(container, job: JobSpec):
+    codec = resolve_video_codec(job.output.codec)
+    try:
+        stream = container.add_stream(codec, rate=job.output.fps)
+    except Exception:
+        # PyAV ships its own libav build, which may lack the hardware encoder
+        # found in the ffmpeg binary.
+        print(f"[WARN] PyAV cannot open encoder {codec}, using libx264.")
+        codec = "libx264"
+        stream = container.add_stream(codec, rate=job.output.fps)
+    stream.width = job.output.canvas.width
+    stream.height = job.output.canvas.height
+    stream.pix_fmt = "yuv420p"
+    stream.codec_context.thread_count = encode_threads()
+    stream.codec_context.options = _codec_options(video_codec_params(codec))
+    return stream
+
+
+def _encode_video(job: JobSpec, layers: list[_Layer], total: float, dest: Path) -> None:
+    canvas = job.output.canvas
+    fps = job.output.fps
+    background = background_frame(canvas.width, canvas.height, canvas.bg_color)
+    frame = np.empty_like(background)
+    # Layers enter in start order; `active` keeps their compositing order.
+    by_start = sorted(range(len(layers)), key=lambda k: layers[k].start)
+    next_layer = 0
+    active: list[int] = []
+    composed_for: tuple[int, ...] | None = None
+
+    container = av.open(str(dest), mode="w")
+    try:
+        stream = _open_video_stream(container, job)
+        for idx in range(max(1, round(total * fps))):
+            t = idx / fps
+            while next_layer < len(by_start) and layers[by_start[next_layer]].start <= t:
+                bisect.insort(active, by_start[next_layer])
+                next_layer += 1
+            active = [k for k in active if t < layers[k].end]
+            key = tuple(active)
+            animated = any(_is_animated(layers[k], t) for k in active)
+            # Most frames are a still with a subtitle: recompose only when the
+            # layer set changes or something is moving or fading.
+            if animated or key != composed_for:
+                np.copyto(frame, background)
+                for k in active:
+                    x, opacity = _layer_state(layers[k], t, canvas.width)
+                    _blit(frame, layers[k], x, opacity)
+                composed_for = None if animated else key
+            video_frame = av.VideoFrame.from_ndarray(frame, format="rgb24")
+            for packet in stream.encode(video_frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    finally:
+        container.close()
+
+
+def render_job_pyav(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    layout: SubtitleLayout,
+    output_path: Path,
+    bgm_path: Path | None = None,
+    cover_path: Path | None = None,
+) -> Path:
+    """
+    Render the planned timeline by compositing frames with numpy and
+    encoding them in-process with PyAV.
+
+    Keeps compositing in Python (unlike the ffmpeg backend) without MoviePy's
+    per-frame clip dispatch; audio and the cover are muxed by ffmpeg after.
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    layers = _build_layers(job, segments, plan, layout, cover_path)
+    with tempfile.TemporaryDirectory(prefix="render-") as tmp:
+        work_dir = Path(tmp)
+        video_path = work_dir / "video.mp4"
+        _encode_video(job, layers, plan.total_duration, video_path)
+        mux_video(
+            ["-i", str(video_path)],
+            job,
+            segments,
+            plan,
+            output_path,
+            bgm_path,
+            cover_path,
+            work_dir,
+        )
+    return output_path
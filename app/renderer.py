@@ -1,29 +1,92 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
 from pathlib import Path
 
-from moviepy import (
-    AudioFileClip,
-    ColorClip,
-    CompositeAudioClip,
-    CompositeVideoClip,
-    ImageClip,
-    TextClip,
-    vfx,
+from moviepy import CompositeVideoClip, ImageClip, vfx
+
+from .ffmpeg_renderer import (
+    ffmpeg_renderer_available,
+    premix_audio,
+    render_job_ffmpeg,
+    stitch_parts,
+)
+from .ffmpeg_utils import (
+    attach_cover_art,
+    available_filters,
+    encode_threads,
+    probe_durations,
+    resolve_video_codec,
+    set_encode_threads,
 )
+from .models import JobSpec, ResolvedSegment, SubtitleLayout, TimelinePlan
+from .pyav_renderer import pyav_renderer_available, render_job_pyav
+from .rendering_utils import background_frame, fitted_image, subtitle_bitmap, write_video
+from .timeline import cover_frame_duration, plan_timeline, subtitle_layout
+
+try:
+    from numba import njit
+except ImportError:  # optional speedup
+    njit = None
+
+
+def _still_clip(image_path: Path, width: int, height: int) -> ImageClip:
+    """Centered still fitted to the canvas, resized once rather than per frame."""
+    fitted = fitted_image(image_path, width, height)
+    return ImageClip(fitted).with_position("center")
+
+
+def _slide_out_x(t: float, hold_until: float, base_x: float, exit_x: float, speed: float):
+    return max(exit_x, base_x - (t - hold_until) * speed)
+
+
+def _slide_in_x(t: float, start_x: float, speed: float):
+    return start_x - max(0.0, t) * speed
+
+
+if njit is not None:
+    # Called for every frame of a slide; compiled once and cached on disk.
+    _slide_out_x = njit(cache=True, fastmath=True)(_slide_out_x)
+    _slide_in_x = njit(cache=True, fastmath=True)(_slide_in_x)
 
-from .models import JobSpec, ResolvedSegment
 
-INTRA_GROUP_CUE_DELAY_SEC = 0.8
+def _slide_out_left_sync(clip, duration: float, canvas_w: int, canvas_h: int):
+    """Slide current clip out to left during its last `duration` seconds."""
+    if duration <= 0:
+        return clip
+    base_x = (canvas_w - clip.w) / 2
+    base_y = (canvas_h - clip.h) / 2
+    rest = (base_x, base_y)
+    hold_until = max(0.0, clip.duration - duration)
+    # Position is evaluated per frame: keep it to one compare and a multiply.
+    speed = (base_x + clip.w) / duration
+    exit_x = float(-clip.w)
 
+    def _pos(t: float):
+        if t <= hold_until:
+            return rest
+        return (_slide_out_x(t, hold_until, base_x, exit_x, speed), base_y)
 
-def _fit_center(clip, width: int, height: int):
-    scale = min(width / clip.w, height / clip.h)
-    new_w = max(2, int(clip.w * scale))
-    new_h = max(2, int(clip.h * scale))
-    if new_w % 2 != 0:
-        new_w -= 1
-    if new_h % 2 != 0:
-        new_h -= 1
-    return clip.resized((new_w, new_h)).with_position("center")
+    return clip.with_position(_pos)
+
+
+def _slide_in_right_sync(clip, duration: float, canvas_w: int, canvas_h: int):
+    """Slide current clip in from right during its first `duration` seconds."""
+    if duration <= 0:
+        return clip
+    base_x = (canvas_w - clip.w) / 2
+    base_y = (canvas_h - clip.h) / 2
+    rest = (base_x, base_y)
+    start_x = float(canvas_w)
+    speed = (start_x - base_x) / duration
+
+    def _pos(t: float):
+        if t >= duration:
+            return rest
+        return (_slide_in_x(t, start_x, speed), base_y)
+
+    return clip.with_position(_pos)
 
 
 def render_job(
@@ -36,222 +99,262 @@ def render_job(
     if not segments:
         raise ValueError("No segments to render.")
 
+    # Timing only needs durations: probe them all up front in parallel.
+    voice_durations = probe_durations(seg.voice_path for seg in segments if seg.voice_path)
+    plan = plan_timeline(job, segments, voice_durations)
+    layout = subtitle_layout(job)
+
+    python_renderer = "pyav" if pyav_renderer_available() else "moviepy"
+    renderer = job.output.renderer
+    if renderer == "pyav" and not pyav_renderer_available():
+        raise ValueError("output.renderer 'pyav' requires PyAV (pip install av)")
+    if renderer == "auto":
+        # Every layer is a still image, so the whole timeline fits one
+        # filtergraph and MoviePy's per-frame Python compositing can be skipped.
+        # Without a font file drawtext needs fontconfig, which `-filters` does
+        # not reveal; the Python renderers fall back to Pillow's default font.
+        has_subtitles = any(t.subtitle_start is not None for t in plan.timings)
+        if ffmpeg_renderer_available() and (layout.font_path or not has_subtitles):
+            renderer = "ffmpeg"
+        else:
+            renderer = python_renderer
+    if renderer == "ffmpeg":
+        if job.output.render_workers > 1 and plan.transition > 0:
+            print(
+                "[WARN] output.render_workers is ignored by the ffmpeg renderer "
+                "unless timeline.transition_sec is 0."
+            )
+        try:
+            return render_job_ffmpeg(
+                job=job,
+                segments=segments,
+                plan=plan,
+                layout=layout,
+                output_path=output_path,
+                bgm_path=bgm_path,
+                cover_path=cover_path,
+            )
+        except RuntimeError as err:
+            if job.output.renderer != "auto":
+                raise
+            print(f"[WARN] ffmpeg renderer failed, falling back to {python_renderer}: {err}")
+            renderer = python_renderer
+    if renderer == "pyav":
+        if job.output.render_workers > 1:
+            print("[WARN] output.render_workers is ignored by the pyav renderer.")
+        return render_job_pyav(
+            job=job,
+            segments=segments,
+            plan=plan,
+            layout=layout,
+            output_path=output_path,
+            bgm_path=bgm_path,
+            cover_path=cover_path,
+        )
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    runs = _group_runs(segments)
+    workers = min(job.output.render_workers, len(runs), os.cpu_count() or 1)
+    if workers > 1:
+        if plan.transition <= 0 or "xfade" in available_filters():
+            return _render_sharded(
+                job, segments, plan, layout, runs, workers, output_path, bgm_path, cover_path
+            )
+        print(
+            "[WARN] output.render_workers is ignored: stitching transitions "
+            "needs ffmpeg's xfade filter."
+        )
+
+    _render_moviepy(job, segments, plan, layout, output_path, bgm_path, cover_path)
+    if cover_path:
+        # MoviePy writes a single video stream, so the cover is muxed after.
+        attach_cover_art(output_path, cover_path)
+    return output_path
+
+
+def _group_runs(segments: list[ResolvedSegment]) -> list[tuple[int, int]]:
+    """[lo, hi) index ranges of consecutive segments sharing a group_id."""
+    runs: list[tuple[int, int]] = []
+    lo = 0
+    for idx in range(1, len(segments) + 1):
+        if idx == len(segments) or segments[idx].group_id != segments[lo].group_id:
+            runs.append((lo, idx))
+            lo = idx
+    return runs
+
+
+def _part_plan(plan: TimelinePlan, lo: int, hi: int) -> TimelinePlan:
+    """Video-only sub-plan for segments [lo, hi), rebased to start at 0."""
+    offset = plan.timings[lo].start
+    timings = []
+    for timing in plan.timings[lo:hi]:
+        subtitle_start = subtitle_end = None
+        if timing.subtitle_start is not None:
+            subtitle_start = timing.subtitle_start - offset
+            subtitle_end = timing.subtitle_end - offset
+        timings.append(
+            replace(
+                timing,
+                start=timing.start - offset,
+                voice_start=0.0,
+                voice_length=0.0,
+                subtitle_start=subtitle_start,
+                subtitle_end=subtitle_end,
+            )
+        )
+    # The group-boundary slide is redone by the stitch step.
+    timings[0].entry = "cut"
+    end = max(t.start + t.duration for t in timings)
+    if hi == len(plan.timings):
+        end = max(end, plan.total_duration - offset)
+    return TimelinePlan(timings=timings, transition=plan.transition, total_duration=end)
+
+
+def _render_sharded(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    layout: SubtitleLayout,
+    runs: list[tuple[int, int]],
+    workers: int,
+    output_path: Path,
+    bgm_path: Path | None,
+    cover_path: Path | None,
+) -> Path:
+    """Render each group in its own process, then stitch them with ffmpeg."""
+    with tempfile.TemporaryDirectory(prefix="parts-") as work_dir:
+        parts = [
+            (Path(work_dir) / f"part{idx}.mp4", plan.timings[lo].start)
+            for idx, (lo, _) in enumerate(runs)
+        ]
+        # Parts encode side by side, so each gets its share of this job's
+        # encoder threads.
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=set_encode_threads,
+            initargs=(max(1, encode_threads() // workers),),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _render_moviepy,
+                    job,
+                    segments[lo:hi],
+                    _part_plan(plan, lo, hi),
+                    layout,
+                    part_path,
+                    None,
+                    # Only the first part holds frame 0.
+                    cover_path if idx == 0 else None,
+                )
+                for idx, ((lo, hi), (part_path, _)) in enumerate(zip(runs, parts))
+            ]
+            for future in futures:
+                future.result()
+        return stitch_parts(
+            job, segments, plan, parts, output_path, bgm_path, cover_path, Path(work_dir)
+        )
+
+
+def _render_moviepy(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    plan: TimelinePlan,
+    layout: SubtitleLayout,
+    output_path: Path,
+    bgm_path: Path | None,
+    cover_path: Path | None,
+) -> Path:
     canvas = job.output.canvas
-    transition = max(0.0, job.timeline.transition_sec)
-    default_still = max(0.1, job.timeline.default_still_sec)
-    voice_offset = max(0.0, job.timeline.voice_start_offset_sec)
-    # Subtitle style scales with canvas size (base design: 1440x2560)
-    subtitle_scale = min(canvas.width / 1440, canvas.height / 2560)
-    scaled_font_size = max(24, int(round(job.subtitle.font_size * subtitle_scale)))
-    scaled_stroke_width = max(1, int(round(job.subtitle.stroke_width * subtitle_scale)))
-    scaled_bottom_margin = max(48, int(round(job.subtitle.bottom_margin * subtitle_scale)))
-    # Extra pad reduces glyph-bottom clipping risk on some fonts/renderers.
-    scaled_subtitle_safe_pad = max(
-        8, int(round(scaled_font_size * 0.2)) + scaled_stroke_width
+    width, height = canvas.width, canvas.height
+    transition = plan.transition
+
+    # Subtitle style is fixed per job; only the text varies per segment.
+    subtitle_style = (
+        layout.font_path,
+        layout.font_size,
+        job.subtitle.color,
+        job.subtitle.stroke_color,
+        layout.stroke_width,
+        layout.safe_pad,
     )
-
-    def _slide_out_left_sync(clip, duration: float):
-        """Slide current clip out to left during its last `duration` seconds."""
-        if duration <= 0:
-            return clip
-        base_x = (canvas.width - clip.w) / 2
-        base_y = (canvas.height - clip.h) / 2
-        hold_until = max(0.0, clip.duration - duration)
-
-        def _pos(t: float):
-            if t <= hold_until:
-                return (base_x, base_y)
-            progress = min(1.0, max(0.0, (t - hold_until) / duration))
-            x = base_x - progress * (base_x + clip.w)
-            return (x, base_y)
-
-        return clip.with_position(_pos)
-
-    def _slide_in_right_sync(clip, duration: float):
-        """Slide current clip in from right during its first `duration` seconds."""
-        if duration <= 0:
-            return clip
-        base_x = (canvas.width - clip.w) / 2
-        base_y = (canvas.height - clip.h) / 2
-        start_x = canvas.width
-
-        def _pos(t: float):
-            progress = min(1.0, max(0.0, t / duration))
-            x = start_x + (base_x - start_x) * progress
-            return (x, base_y)
-
-        return clip.with_position(_pos)
-
-    opened_audio_sources: list[AudioFileClip] = []
+    subtitle_bottom = height - layout.bottom_margin
+
+    # MoviePy effects may mutate themselves when applied, so each clip gets a
+    # copy of this prototype rather than the shared instance.
+    cross_fade_in = vfx.CrossFadeIn(transition) if transition > 0 else None
+
+    # Effects of a group often reuse one source image: decode and fit each
+    # distinct path once. Clips derived via with_duration share its frame and
+    # alpha mask arrays instead of holding a copy each.
+    stills: dict[Path, ImageClip] = {}
+    for seg in segments:
+        if seg.image_path not in stills:
+            stills[seg.image_path] = _still_clip(seg.image_path, width, height)
+
+    # Comments often repeat within a job; rasterize each distinct one once.
+    bitmaps: dict[str, tuple] = {}
     video_layers = []
     subtitle_layers = []
-    audio_tracks = []
-
-    cursor = 0.0
-    durations: list[float] = []
-    starts: list[float] = []
-    subtitle_segment_indices: list[int] = []
-    subtitle_start_times: dict[int, float] = {}
-    subtitle_end_times: dict[int, float] = {}
-    max_visual_voice_end = 0.0
-
-    try:
-        for idx, seg in enumerate(segments):
-            is_group_first = idx == 0 or seg.group_id != segments[idx - 1].group_id
-            segment_voice_offset = (
-                voice_offset if is_group_first else INTRA_GROUP_CUE_DELAY_SEC
+    for seg, timing in zip(segments, plan.timings):
+        clip = stills[seg.image_path].with_duration(timing.duration).with_start(timing.start)
+        if timing.entry == "slide":
+            # Between groups: sync both motions in same transition window.
+            video_layers[-1] = _slide_out_left_sync(
+                video_layers[-1], transition, width, height
             )
-            voice_src = None
-            voice_duration = 0.0
-            voice_end = 0.0
-            if seg.voice_path and seg.voice_path.exists():
-                voice_src = AudioFileClip(str(seg.voice_path))
-                opened_audio_sources.append(voice_src)
-                voice_duration = voice_src.duration
-
-            segment_duration = max(default_still, voice_duration + segment_voice_offset)
-            # Cross dissolve: overlap next clip by `transition` seconds.
-            start = cursor if idx == 0 else cursor - transition
-            starts.append(start)
-            durations.append(segment_duration)
-
-            clip = ImageClip(str(seg.image_path), duration=segment_duration)
-            clip = _fit_center(clip, canvas.width, canvas.height).with_start(start)
-            max_visual_voice_end = max(max_visual_voice_end, start + segment_duration)
-
-            if idx > 0 and transition > 0:
-                prev_group_id = segments[idx - 1].group_id
-                curr_group_id = seg.group_id
-                is_group_boundary = prev_group_id != curr_group_id
-
-                if is_group_boundary:
-                    # Between groups: sync both motions in same transition window.
-                    video_layers[-1] = _slide_out_left_sync(video_layers[-1], transition)
-                    clip = _slide_in_right_sync(clip, transition)
-                else:
-                    # Inside same group: keep current cross dissolve transition.
-                    clip = clip.with_effects([vfx.CrossFadeIn(transition).copy()])
-            video_layers.append(clip)
-
-            if voice_src:
-                available = max(0.0, segment_duration - segment_voice_offset)
-                voice_end = min(voice_src.duration, available)
-
-            if seg.comment:
-                # Subtitle duration rules:
-                # - with voice: subtitle starts with voice and follows voice_end
-                # - without voice: follow full segment duration
-                # - always end a bit earlier to avoid overlap flash
-                subtitle_start = start + segment_voice_offset if voice_src else start
-                raw_subtitle_duration = voice_end if voice_src else segment_duration
-                subtitle_duration = min(
-                    segment_duration,
-                    max(0.05, raw_subtitle_duration - 0.05),
-                )
-                text_kwargs = {
-                    "text": seg.comment,
-                    "font_size": scaled_font_size,
-                    "color": job.subtitle.color,
-                    "stroke_color": job.subtitle.stroke_color,
-                    "stroke_width": scaled_stroke_width,
-                    "margin": (0, 0, 0, scaled_subtitle_safe_pad),
-                    "duration": subtitle_duration,
-                }
-                if job.subtitle.font_path and Path(job.subtitle.font_path).exists():
-                    text_kwargs["font"] = job.subtitle.font_path
-                subtitle = TextClip(**text_kwargs).with_start(subtitle_start)
-                x_left = (canvas.width - subtitle.w) / 2
-                y_top = canvas.height - scaled_bottom_margin - subtitle.h
-                subtitle = subtitle.with_position((max(0, x_left), max(0, y_top)))
-                subtitle_layers.append(subtitle)
-                subtitle_segment_indices.append(idx)
-                subtitle_start_times[idx] = subtitle_start
-                subtitle_end_times[idx] = subtitle_start + subtitle_duration
-
-            if voice_src:
-                if voice_end > 0:
-                    voice_clip = voice_src.subclipped(0, voice_end).with_start(
-                        start + segment_voice_offset
-                    )
-                    if job.audio.voice_volume != 1.0:
-                        voice_clip = voice_clip.with_volume_scaled(job.audio.voice_volume)
-                    audio_tracks.append(voice_clip)
-                    max_visual_voice_end = max(
-                        max_visual_voice_end, start + segment_voice_offset + voice_end
-                    )
-
-            # Keep overlap timing consistent at every boundary.
-            # First clip advances by full duration; following clips advance by
-            # "duration - transition" because their starts are shifted earlier.
-            if idx == 0:
-                cursor += segment_duration
-            else:
-                cursor += max(0.0, segment_duration - transition)
-
-        # Hard-cut subtitle before next segment start to avoid adjacent overlap.
-        subtitle_gap = 0.05
-        for layer_idx, subtitle in enumerate(subtitle_layers):
-            seg_idx = subtitle_segment_indices[layer_idx]
-            if seg_idx + 1 >= len(starts):
-                continue
-            original_end = subtitle_end_times.get(seg_idx)
-            if original_end is None:
-                continue
-            capped_end = min(original_end, starts[seg_idx + 1] - subtitle_gap)
-            subtitle_start = subtitle_start_times.get(seg_idx, starts[seg_idx])
-            new_duration = max(0.05, capped_end - subtitle_start)
-            subtitle_layers[layer_idx] = subtitle.with_duration(new_duration)
-            subtitle_end_times[seg_idx] = subtitle_start + new_duration
-
-        # Trim by the actual latest content end (visual/subtitle/voice).
-        subtitle_max_end = max(subtitle_end_times.values(), default=0.0)
-        total_duration = max(max_visual_voice_end, subtitle_max_end, 0.1)
-
-        bg = ColorClip(
-            size=(canvas.width, canvas.height),
-            color=canvas.bg_color,
-            duration=total_duration,
-        )
-        first_frame_cover_layers = []
-        if cover_path and cover_path.exists():
-            cover_frame_duration = max(1.0 / max(1, job.output.fps), 0.04)
-            cover_clip = ImageClip(str(cover_path), duration=cover_frame_duration)
-            cover_clip = _fit_center(cover_clip, canvas.width, canvas.height).with_start(0)
-            # Put cover on top so frame-0 preview matches requested thumbnail.
-            first_frame_cover_layers.append(cover_clip)
-
-        final = CompositeVideoClip(
-            [bg, *video_layers, *subtitle_layers, *first_frame_cover_layers]
+            clip = _slide_in_right_sync(clip, transition, width, height)
+        elif timing.entry == "fade":
+            # Inside same group: keep current cross dissolve transition.
+            clip = clip.with_effects([cross_fade_in.copy()])
+        video_layers.append(clip)
+
+        if timing.subtitle_start is not None:
+            subtitle_duration = timing.subtitle_end - timing.subtitle_start
+            if seg.comment not in bitmaps:
+                bitmaps[seg.comment] = subtitle_bitmap(seg.comment, *subtitle_style)
+            rgb, mask = bitmaps[seg.comment]
+            subtitle = (
+                ImageClip(rgb, duration=subtitle_duration)
+                .with_mask(ImageClip(mask, is_mask=True, duration=subtitle_duration))
+                .with_start(timing.subtitle_start)
+            )
+            x_left = (width - subtitle.w) / 2
+            y_top = subtitle_bottom - subtitle.h
+            subtitle = subtitle.with_position((max(0, x_left), max(0, y_top)))
+            subtitle_layers.append(subtitle)
+
+    bg = ImageClip(
+        background_frame(width, height, canvas.bg_color),
+        duration=plan.total_duration,
+    )
+    first_frame_cover_layers = []
+    if cover_path and cover_path.exists():
+        cover_clip = (
+            _still_clip(cover_path, width, height)
+            .with_duration(cover_frame_duration(job.output.fps))
+            .with_start(0)
         )
+        # Put cover on top so frame-0 preview matches requested thumbnail.
+        first_frame_cover_layers.append(cover_clip)
+
+    # use_bgclip: composite straight onto our frame instead of a second,
+    # internally generated black ColorClip underneath it.
+    final = CompositeVideoClip(
+        [bg, *video_layers, *subtitle_layers, *first_frame_cover_layers],
+        use_bgclip=True,
+    )
 
-        if bgm_path and bgm_path.exists():
-            bgm_src = AudioFileClip(str(bgm_path))
-            opened_audio_sources.append(bgm_src)
-            bgm_end = min(total_duration, bgm_src.duration)
-            if bgm_end > 0:
-                bgm = bgm_src.subclipped(0, bgm_end)
-                if job.audio.bgm_volume != 1.0:
-                    bgm = bgm.with_volume_scaled(job.audio.bgm_volume)
-                audio_tracks.insert(0, bgm)
-
-        if audio_tracks:
-            final = final.with_audio(CompositeAudioClip(audio_tracks))
-
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        final.write_videofile(
-            str(output_path),
-            fps=job.output.fps,
-            codec="libx264",
-            pixel_format="yuv420p",
-            audio_codec="aac",
-            # ffmpeg_params=["-preset", "veryfast"],
-            ffmpeg_params=["-preset", "ultrafast"],
+    codec = resolve_video_codec(job.output.codec)
+    with tempfile.TemporaryDirectory(prefix="audio-") as work_dir:
+        # ffmpeg mixes bgm and voices natively in one pass; MoviePy then only
+        # muxes the finished track instead of decoding and summing in Python.
+        soundtrack = premix_audio(job, segments, plan, bgm_path, Path(work_dir) / "mix.wav")
+        write_video(
+            final,
+            output_path,
+            job.output.fps,
+            codec=codec,
+            audio=str(soundtrack) if soundtrack else False,
         )
-        final.close()
-        return output_path
-    finally:
-        for audio in opened_audio_sources:
-            try:
-                audio.close()
-            except Exception:
-                pass
+    final.close()
+    return output_path
@@ -0,0 +1,117 @@
+import functools
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFilter, ImageFont
+
+from .ffmpeg_utils import encode_threads, video_codec_params
+
+try:
+    import pyvips
+except ImportError:  # optional speedup
+    pyvips = None
+
+
+def fit_size(src_w: int, src_h: int, width: int, height: int) -> tuple[int, int]:
+    scale = min(width / src_w, height / src_h)
+    new_w = max(2, int(src_w * scale))
+    new_h = max(2, int(src_h * scale))
+    if new_w % 2 != 0:
+        new_w -= 1
+    if new_h % 2 != 0:
+        new_h -= 1
+    return new_w, new_h
+
+
+def fitted_image(image_path: Path, width: int, height: int) -> np.ndarray:
+    """Decode an image and fit it into the canvas once, ready for every frame."""
+    if pyvips is not None:
+        image = pyvips.Image.thumbnail(str(image_path), width, height=height)
+        image = image.colourspace("srgb")
+        # Keep even dimensions for yuv420p, like fit_size.
+        even_w = max(2, image.width - image.width % 2)
+        even_h = max(2, image.height - image.height % 2)
+        image = image.crop(0, 0, even_w, even_h)
+        return np.ndarray(
+            buffer=image.write_to_memory(),
+            dtype=np.uint8,
+            shape=(image.height, image.width, image.bands),
+        )
+    with Image.open(image_path) as image:
+        # Keep alpha so transparent stills still get a mask from ImageClip.
+        mode = "RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB"
+        size = fit_size(image.width, image.height, width, height)
+        fitted = image.convert(mode).resize(size, Image.Resampling.LANCZOS)
+    return np.asarray(fitted)
+
+
+@functools.lru_cache(maxsize=4)
+def background_frame(width: int, height: int, color: tuple[int, int, int]) -> np.ndarray:
+    """Solid uint8 canvas, built once per size/color and shared across jobs."""
+    # ColorClip tiles the color as int64 and converts it again on every frame.
+    frame = np.full((height, width, 3), color, dtype=np.uint8)
+    frame.flags.writeable = False
+    return frame
+
+
+@functools.lru_cache(maxsize=8)
+def _load_font(font_path: str | None, font_size: int):
+    if font_path:
+        return ImageFont.truetype(font_path, font_size)
+    return ImageFont.load_default(font_size)
+
+
+def subtitle_bitmap(
+    text: str,
+    font_path: str | None,
+    font_size: int,
+    color: str,
+    stroke_color: str,
+    stroke_width: int,
+    safe_pad: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rasterize a subtitle to an RGB array and a float opacity mask.
+
+    Bitmaps are full-width arrays, so callers cache them per render rather
+    than this module holding them across jobs.
+    """
+    font = _load_font(font_path, font_size)
+    probe = ImageDraw.Draw(Image.new("L", (1, 1)))
+    left, _, right, bottom = probe.textbbox((0, 0), text, font=font)
+    pad = stroke_width
+    size = (right - left + 2 * pad, bottom + 2 * pad + safe_pad)
+
+    # Glyph coverage only; the stroke is that coverage dilated by the stroke
+    # width, one C-level max filter instead of stroking every glyph outline.
+    fill = Image.new("L", size, 0)
+    ImageDraw.Draw(fill).text((pad - left, pad), text, font=font, fill=255)
+    outline = fill
+    if stroke_width > 0:
+        outline = fill.filter(ImageFilter.MaxFilter(2 * stroke_width + 1))
+
+    coverage = np.asarray(fill, dtype=np.float32)[:, :, None] / 255.0
+    stroke_rgb = np.asarray(ImageColor.getrgb(stroke_color)[:3], dtype=np.float32)
+    fill_rgb = np.asarray(ImageColor.getrgb(color)[:3], dtype=np.float32)
+    rgb = (stroke_rgb + (fill_rgb - stroke_rgb) * coverage).astype(np.uint8)
+    mask = np.asarray(outline, dtype=np.float32) / 255.0
+    return rgb, mask
+
+
+def write_video(
+    clip, output_path: Path, fps: int, codec: str = "libx264", audio: bool | str = True
+) -> None:
+    """Encode a MoviePy clip with the shared per-codec tuning, quietly."""
+    clip.write_videofile(
+        str(output_path),
+        fps=fps,
+        codec=codec,
+        pixel_format="yuv420p",
+        audio=audio,
+        audio_codec="aac",
+        ffmpeg_params=video_codec_params(codec),
+        threads=encode_threads(),
+        # No progress bar or log file: per-frame callbacks cost time.
+        logger=None,
+        write_logfile=False,
+    )
@@ -1,14 +1,158 @@
-from .models import JobSpec, NodeSpec
+from collections.abc import Iterator
+from pathlib import Path
+from typing import NamedTuple
 
+import numpy as np
 
-def build_sequence_nodes(job: JobSpec) -> list[tuple[str, str, NodeSpec]]:
+from .models import (
+    JobSpec,
+    NodeSpec,
+    ResolvedSegment,
+    SegmentTiming,
+    SubtitleLayout,
+    TimelinePlan,
+)
+
+INTRA_GROUP_CUE_DELAY_SEC = 0.8
+SUBTITLE_GAP_SEC = 0.05
+
+
+class SeqNode(NamedTuple):
+    group_id: str
+    kind: str  # "original" | "effect"
+    node: NodeSpec
+
+
+def build_sequence_nodes(job: JobSpec) -> Iterator[SeqNode]:
     """
-    Returns linear sequence as:
-    [(group_id, "original"|"effect", node), ...]
+    Yields the linear sequence as:
+    SeqNode(group_id, "original"|"effect", node), ...
     """
-    sequence: list[tuple[str, str, NodeSpec]] = []
     for group in job.groups:
-        sequence.append((group.group_id, "original", group.original))
+        yield SeqNode(group.group_id, "original", group.original)
         for effect in group.effects:
-            sequence.append((group.group_id, "effect", effect))
-    return sequence
+            yield SeqNode(group.group_id, "effect", effect)
+
+
+def cover_frame_duration(fps: int) -> float:
+    """How long the cover stays on top at the start: one frame, at least 40 ms."""
+    return max(1.0 / max(1, fps), 0.04)
+
+
+def subtitle_layout(job: JobSpec) -> SubtitleLayout:
+    canvas = job.output.canvas
+    # Subtitle style scales with canvas size (base design: 1440x2560)
+    scale = min(canvas.width / 1440, canvas.height / 2560)
+    font_size = max(24, int(round(job.subtitle.font_size * scale)))
+    stroke_width = max(1, int(round(job.subtitle.stroke_width * scale)))
+    font_path = job.subtitle.font_path
+    return SubtitleLayout(
+        font_size=font_size,
+        stroke_width=stroke_width,
+        bottom_margin=max(48, int(round(job.subtitle.bottom_margin * scale))),
+        # Extra pad reduces glyph-bottom clipping risk on some fonts/renderers.
+        safe_pad=max(8, int(round(font_size * 0.2)) + stroke_width),
+        font_path=font_path if font_path and Path(font_path).exists() else None,
+    )
+
+
+def plan_timeline(
+    job: JobSpec,
+    segments: list[ResolvedSegment],
+    voice_durations: dict[Path, float],
+) -> TimelinePlan:
+    """
+    Lay segments out on the output timeline.
+
+    Shared by every render backend so they agree on clip, voice and subtitle
+    timing. `voice_durations` holds the probed length of each usable voice file.
+    """
+    transition = max(0.0, job.timeline.transition_sec)
+    default_still = max(0.1, job.timeline.default_still_sec)
+    voice_offset = max(0.0, job.timeline.voice_start_offset_sec)
+
+    if not segments:
+        return TimelinePlan(timings=[], transition=transition, total_duration=0.1)
+
+    # Pass 1: per-segment voice cue offset and duration.
+    group_first = [
+        idx == 0 or seg.group_id != segments[idx - 1].group_id
+        for idx, seg in enumerate(segments)
+    ]
+    voice_offsets = np.empty(len(segments))
+    durations = np.empty(len(segments))
+    for idx, (seg, is_group_first) in enumerate(zip(segments, group_first)):
+        voice_offsets[idx] = voice_offset if is_group_first else INTRA_GROUP_CUE_DELAY_SEC
+        voice_duration = voice_durations.get(seg.voice_path, 0.0)
+        durations[idx] = max(default_still, voice_duration + voice_offsets[idx])
+
+    # Starts in closed form. Cross dissolve: each clip after the first
+    # overlaps the previous one by `transition`, so the cursor advances by the
+    # full first duration and by "duration - transition" afterwards.
+    advances = np.maximum(0.0, durations - transition)
+    advances[0] = durations[0]
+    cursors = np.cumsum(advances)
+    starts = np.empty(len(segments))
+    starts[0] = 0.0
+    starts[1:] = cursors[:-1] - transition
+    content_end = float(np.max(starts + durations))
+
+    # Pass 2: entries, voice and subtitle windows.
+    timings: list[SegmentTiming] = []
+    for idx, (seg, is_group_first) in enumerate(zip(segments, group_first)):
+        start = float(starts[idx])
+        duration = float(durations[idx])
+        segment_voice_offset = float(voice_offsets[idx])
+        has_voice = seg.voice_path in voice_durations
+        voice_duration = voice_durations.get(seg.voice_path, 0.0)
+
+        if idx == 0 or transition <= 0:
+            entry = "cut"
+        elif is_group_first:
+            # Between groups: previous clip slides out while this one slides in.
+            entry = "slide"
+        else:
+            entry = "fade"
+        timing = SegmentTiming(start=start, duration=duration, entry=entry)
+
+        if has_voice:
+            timing.voice_start = start + segment_voice_offset
+            timing.voice_length = min(
+                voice_duration, max(0.0, duration - segment_voice_offset)
+            )
+            if timing.voice_length > 0:
+                content_end = max(content_end, timing.voice_start + timing.voice_length)
+
+        if seg.comment:
+            # Subtitle duration rules:
+            # - with voice: subtitle starts with voice and follows voice_end
+            # - without voice: follow full segment duration
+            # - always end a bit earlier to avoid overlap flash
+            subtitle_start = timing.voice_start if has_voice else start
+            raw_subtitle_duration = timing.voice_length if has_voice else duration
+            subtitle_duration = min(duration, max(0.05, raw_subtitle_duration - 0.05))
+            timing.subtitle_start = subtitle_start
+            timing.subtitle_end = subtitle_start + subtitle_duration
+        timings.append(timing)
+
+    # Hard-cut subtitle before next segment start to avoid adjacent overlap.
+    capped = [idx for idx, t in enumerate(timings[:-1]) if t.subtitle_start is not None]
+    if capped:
+        indices = np.asarray(capped)
+        starts = np.asarray([t.start for t in timings])
+        sub_starts = np.asarray([timings[idx].subtitle_start for idx in capped])
+        sub_ends = np.asarray([timings[idx].subtitle_end for idx in capped])
+        capped_ends = np.minimum(sub_ends, starts[indices + 1] - SUBTITLE_GAP_SEC)
+        new_ends = sub_starts + np.maximum(0.05, capped_ends - sub_starts)
+        for idx, end in zip(capped, new_ends.tolist()):
+            timings[idx].subtitle_end = end
+
+    # Trim by the actual latest content end (visual/subtitle/voice).
+    subtitle_max_end = max(
+        (t.subtitle_end for t in timings if t.subtitle_end is not None), default=0.0
+    )
+    return TimelinePlan(
+        timings=timings,
+        transition=transition,
+        total_duration=max(content_end, subtitle_max_end, 0.1),
+    )
@@ -12,14 +12,19 @@ from pathlib import Path
 
 from moviepy import (
     AudioFileClip,
-    ColorClip,
     CompositeVideoClip,
     CompositeAudioClip,
     ImageClip,
-    TextClip,
     vfx,
 )
 
+from app.rendering_utils import (
+    background_frame,
+    fitted_image,
+    subtitle_bitmap,
+    write_video,
+)
+
 
 def main():
     # 项目根目录（脚本所在目录即 pythonProject2）
@@ -39,46 +44,37 @@ def main():
 
     # 黑色背景：按图片段总时长设置，避免拉长最终时间轴
     sequence_duration = duration_per_image * len(image_paths) - transition_duration * (len(image_paths) - 1)
-    black_bg = ColorClip(size=(canvas_w, canvas_h), color=(0, 0, 0), duration=sequence_duration)
-
-    def fit_center(clip, w, h):
-        """将片段缩放到 (w,h) 内保持比例，并居中。"""
-        scale = min(w / clip.w, h / clip.h)
-        nw, nh = int(clip.w * scale), int(clip.h * scale)
-        if nw % 2 != 0:
-            nw -= 1
-        if nh % 2 != 0:
-            nh -= 1
-        return clip.resized((nw, nh)).with_position("center")
-
-    # 第一张图：3 秒，末尾 0.5 秒淡出，适配画布并居中
+    black_bg = ImageClip(
+        background_frame(canvas_w, canvas_h, (0, 0, 0)), duration=sequence_duration
+    )
+
+    # 第一张图：3 秒，末尾 0.5 秒淡出，预先缩放到画布内并居中
+    image1, image2 = (fitted_image(p, canvas_w, canvas_h) for p in image_paths)
     clip1 = (
-        ImageClip(str(image_paths[0]), duration=duration_per_image)
+        ImageClip(image1, duration=duration_per_image)
         .with_effects([vfx.CrossFadeOut(transition_duration).copy()])
+        .with_position("center")
     )
-    clip1 = fit_center(clip1, canvas_w, canvas_h)
-    # 第二张图：3 秒，开头 0.5 秒淡入，从 2.5 秒开始，适配画布并居中
+    # 第二张图：3 秒，开头 0.5 秒淡入，从 2.5 秒开始，预先缩放到画布内并居中
     clip2 = (
-        ImageClip(str(image_paths[1]), duration=duration_per_image)
+        ImageClip(image2, duration=duration_per_image)
         .with_effects([vfx.CrossFadeIn(transition_duration).copy()])
         .with_start(duration_per_image - transition_duration)
+        .with_position("center")
     )
-    clip2 = fit_center(clip2, canvas_w, canvas_h)
 
     # 字幕：画布底部居中，与底边留 70px 边距，整行完整显示
     font_path = "C:/Windows/Fonts/msyh.ttc"
     if not Path(font_path).exists():
         font_path = "C:/Windows/Fonts/simhei.ttf"
-    text_clip = TextClip(
-        text="123aB!@你好",
-        font=font_path,
-        font_size=72,
-        color="white",
-        stroke_color="black",
-        stroke_width=2,
-        margin=(0, 0, 0, 350),
-        duration=3,
-    ).with_start(2)
+    text_rgb, text_mask = subtitle_bitmap(
+        "123aB!@你好", font_path, 72, "white", "black", 2, 350
+    )
+    text_clip = (
+        ImageClip(text_rgb, duration=3)
+        .with_mask(ImageClip(text_mask, is_mask=True, duration=3))
+        .with_start(2)
+    )
     # 使用底部对齐 + 下边透明留白，避免字体度量差异导致贴底和裁剪
     text_clip = text_clip.with_position(("center", "bottom"))
 
@@ -105,14 +101,7 @@ def main():
     if audio_clips:
         final = final.with_audio(CompositeAudioClip(audio_clips))
 
-    final.write_videofile(
-        str(output_path),
-        fps=30,
-        codec="libx264",
-        pixel_format="yuv420p",
-        audio_codec="aac",
-        ffmpeg_params=["-preset", "veryfast"],
-    )
+    write_video(final, output_path, fps=30)
     final.close()
     print(f"已生成视频: {output_path}")
 